@@ -0,0 +1,166 @@
+"""
+Batch experiment read-outs.
+
+Fetches receipts for a list of experiments with a bounded number of concurrent queries,
+runs the bootstrap and confidence interval for each on a process pool, and writes one
+Markdown report per experiment plus a combined `summary.md`.
+
+  python experimentation/batch_report.py exp_a exp_b --control off --treatment on --output reports/
+  python experimentation/batch_report.py --file experiments.txt --backend duckdb --data-dir extracts/
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import zlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import experiment_functions as ef
+
+
+# Bootstrap & CI for a Single Experiment (runs in a worker process)
+def analyze_experiment(experiment_id, data, control, treatment, metric_type, num_iterations, p_value, test_type, one_tail_direction = None, seed = None):
+  missing = [v for v in (control, treatment) if not (data['variant'] == v).any()]
+  if missing:
+    raise ValueError(f"variant(s) {', '.join(map(repr, missing))} not found in the experiment data")
+
+  diff_means, means_control, means_treatment = ef.bootstrap_sample(data, 'variant', metric_type, control, treatment, num_iterations, seed = seed)
+  confidence_interval = ef.return_conf_interval(diff_means, p_value, test_type, one_tail_direction)
+  if not np.all(np.isfinite(confidence_interval)):
+    raise ValueError(f"confidence interval is not finite: {tuple(confidence_interval)}")
+
+  return {
+    'Experiment ID': experiment_id,
+    'Control': control,
+    'Treatment': treatment,
+    'Control Mean': np.nanmean(means_control),
+    'Treatment Mean': np.nanmean(means_treatment),
+    'Mean Difference': np.nanmean(diff_means),
+    'CI Lower': confidence_interval[0],
+    'CI Upper': confidence_interval[1],
+    'Significant': not (confidence_interval[0] <= 0 <= confidence_interval[1]),
+    'Markdown': ef.results_markdown(confidence_interval, p_value, test_type, treatment, control),
+  }
+
+
+
+# Combined Markdown Summary Table
+def summary_markdown(results, errors = None):
+  cols = ['Experiment ID', 'Control', 'Treatment', 'Control Mean', 'Treatment Mean', 'Mean Difference', 'CI Lower', 'CI Upper', 'Significant']
+
+  def fmt(x):
+    return f"{x:.4f}" if isinstance(x, float) else str(x)
+
+  lines = ['# <u>Experiment Summary</u>', '', '| ' + ' | '.join(cols) + ' |', '|' + '---|' * len(cols)]
+  for r in sorted(results, key = lambda r: r['Experiment ID']):
+    lines.append('| ' + ' | '.join(fmt(r[c]) for c in cols) + ' |')
+
+  if errors:
+    lines += ['', '## Failed Experiments', '']
+    lines += [f"- `{experiment_id}`: {err}" for experiment_id, err in sorted(errors.items())]
+
+  return '\n'.join(lines) + '\n'
+
+
+
+def run_batch(experiment_ids, control, treatment, metric_type = 'total', num_iterations = 1000, p_value = 0.05,
+              test_type = 'two-tailed', one_tail_direction = None, max_queries = 8, workers = None, seed = None):
+  """
+  Run the read-out for every experiment in `experiment_ids`.
+  Each experiment bootstraps from a seed derived from (`seed`, experiment id), so a read-out is reproducible
+  on its own whatever else is in the batch, and worker processes never share a resample stream.
+  Returns a list of per-experiment result dicts and a dict of {experiment_id: error message}.
+  """
+  results, errors = [], {}
+  base_seed = np.random.SeedSequence().entropy if seed is None else seed
+  seeds = {e: np.random.SeedSequence([base_seed, zlib.crc32(str(e).encode())]) for e in experiment_ids}
+
+  # Spawned (not forked) workers: the fetch threads are already running when the pool starts processes
+  with ThreadPoolExecutor(max_workers = max_queries) as fetch_pool, \
+       ProcessPoolExecutor(max_workers = workers, mp_context = multiprocessing.get_context('spawn')) as compute_pool:
+    fetches = {fetch_pool.submit(ef.get_experiment_receipts, e, control, treatment): e for e in experiment_ids}
+    analyses = {}
+
+    # Hand each experiment to the process pool as soon as its data lands
+    for future in as_completed(fetches):
+      # Drop the finished fetch so its DataFrame is freed once the analysis no longer needs it
+      experiment_id = fetches.pop(future)
+      try:
+        data = future.result()
+      except Exception as err:
+        errors[experiment_id] = f"query failed: {err}"
+        continue
+      if data is None or data.empty:
+        errors[experiment_id] = "no receipts returned"
+        continue
+
+      analyses[compute_pool.submit(analyze_experiment, experiment_id, data, control, treatment, metric_type,
+                                   num_iterations, p_value, test_type, one_tail_direction, seeds[experiment_id])] = experiment_id
+      del future, data
+
+    for future in as_completed(analyses):
+      try:
+        results.append(future.result())
+      except Exception as err:
+        errors[analyses[future]] = f"analysis failed: {err}"
+
+  return results, errors
+
+
+
+def write_reports(results, errors, output_dir):
+  os.makedirs(output_dir, exist_ok = True)
+  for r in results:
+    with open(os.path.join(output_dir, f"{r['Experiment ID']}.md"), 'w') as f:
+      f.write(r['Markdown'])
+  with open(os.path.join(output_dir, 'summary.md'), 'w') as f:
+    f.write(summary_markdown(results, errors))
+
+
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(description = 'Run bootstrap read-outs for a batch of experiments.')
+  parser.add_argument('experiment_ids', nargs = '*', help = 'experiment ids (config flags)')
+  parser.add_argument('--file', help = 'file with one experiment id per line')
+  parser.add_argument('--control', default = 'off', help = 'control variant id')
+  parser.add_argument('--treatment', default = 'on', help = 'treatment variant id')
+  parser.add_argument('--metric', default = 'total', choices = ['total', 'bad_recoupments', 'chargebacks'])
+  parser.add_argument('--iterations', type = int, default = 1000)
+  parser.add_argument('--p-value', type = float, default = 0.05)
+  parser.add_argument('--test-type', default = 'two-tailed', choices = ['one-tailed', 'two-tailed'])
+  parser.add_argument('--direction', choices = ['increase', 'decrease'], help = 'direction for one-tailed tests')
+  parser.add_argument('--max-queries', type = int, default = 8, help = 'concurrent warehouse queries')
+  parser.add_argument('--workers', type = int, default = None, help = 'bootstrap processes (default: CPU count)')
+  parser.add_argument('--seed', type = int, default = None, help = 'base seed for reproducible bootstraps')
+  parser.add_argument('--backend', choices = ['bigquery', 'duckdb'], default = ef.backend)
+  parser.add_argument('--data-dir', help = 'Parquet extract directory for the duckdb backend')
+  parser.add_argument('--output', default = 'experiment_reports', help = 'directory for the Markdown reports')
+  args = parser.parse_args(argv)
+
+  experiment_ids = list(args.experiment_ids)
+  if args.file:
+    with open(args.file) as f:
+      experiment_ids += [line.strip() for line in f if line.strip()]
+  if not experiment_ids:
+    parser.error('no experiment ids given')
+  if args.test_type == 'one-tailed' and not args.direction:
+    parser.error('--direction is required for one-tailed tests')
+
+  try:
+    ef.set_backend(args.backend, args.data_dir)
+  except ValueError as err:
+    parser.error(str(err))
+
+  results, errors = run_batch(list(dict.fromkeys(experiment_ids)), args.control, args.treatment, args.metric, args.iterations,
+                              args.p_value, args.test_type, args.direction, args.max_queries, args.workers, args.seed)
+  write_reports(results, errors, args.output)
+
+  print(f"{len(results)} experiment(s) reported, {len(errors)} failed; reports written to {args.output}")
+  return 1 if errors else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
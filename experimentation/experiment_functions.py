@@ -2,15 +2,122 @@
 from google.cloud import bigquery
 import pandas as pd
 import numpy as np
+import os
+import re
+import threading
 
 proj = 'etsy-bigquery-adhoc-prod'
-client = bigquery.Client(project = proj)
+client = None
+
+# Query backend: 'bigquery' (default) or 'duckdb' (local Parquet extracts under `data_dir`)
+backend = os.environ.get('EXPERIMENT_BACKEND', 'bigquery')
+data_dir = os.environ.get('EXPERIMENT_DATA_DIR')
+_duck_conn = None
+_duck_views = set()
+_duck_lock = threading.Lock()
+
+def _check_backend(name, path):
+  if name not in ('bigquery', 'duckdb'):
+    raise ValueError(f"Unknown backend '{name}': expected 'bigquery' or 'duckdb'")
+  if name == 'duckdb' and not path:
+    raise ValueError("The duckdb backend needs a directory of Parquet extracts (EXPERIMENT_DATA_DIR or set_backend's path)")
+
+# Fail at import, not on the first query, when the environment asks for an unusable backend
+_check_backend(backend, data_dir)
+
+def get_client():
+  global client
+  if client is None:
+    client = bigquery.Client(project = proj)
+  return client
+
+def set_backend(name, path = None):
+  """
+  Switch the backend used by `query_to_df`. For 'duckdb', `path` is a directory holding one
+  Parquet extract per warehouse table, laid out as `<path>/<dataset>/<table>.parquet`
+  (or a `<path>/<dataset>/<table>/` directory of Parquet files).
+  """
+  global backend, data_dir, _duck_conn
+  _check_backend(name, path or data_dir)
+
+  with _duck_lock:
+    backend = name
+    if path:
+      data_dir = path
+    _duck_conn = None
+    _duck_views.clear()
 
 def query_to_df(sql:str) -> pd.DataFrame:
-    query_job = client.query(sql)
+    if backend == 'duckdb':
+      return _duckdb_query_to_df(sql)
+    query_job = get_client().query(sql)
     results = query_job.result()
     return results.to_dataframe()
 
+
+
+# Offline DuckDB Backend
+_TABLE_REF = re.compile(r"`[\w-]+`?\.(\w+)\.(\w+)`?")
+
+def _parquet_source(dataset, table):
+  file_path = os.path.join(data_dir, dataset, f'{table}.parquet')
+  if os.path.isfile(file_path):
+    return file_path
+  dir_path = os.path.join(data_dir, dataset, table)
+  if os.path.isdir(dir_path):
+    return os.path.join(dir_path, '*.parquet')
+  raise FileNotFoundError(f"No Parquet extract for {dataset}.{table} under {data_dir}")
+
+def to_duckdb_sql(sql:str) -> str:
+  """
+  Translate the BigQuery SQL used in this module into DuckDB SQL.
+  Warehouse tables are renamed to `<dataset>__<table>` views.
+  """
+  # Scripting variables: inline each `SET var = value;` and drop the DECLARE/SET statements
+  for name, value in re.findall(r"\bSET\s+(\w+)\s*=\s*([^;]+);", sql):
+    sql = re.sub(rf"\b{name}\b", lambda m: value.strip(), re.sub(rf"\b(DECLARE|SET)\s+{name}\b[^;]*;", "", sql))
+
+  sql = _TABLE_REF.sub(lambda m: f"{m.group(1)}__{m.group(2)}", sql)
+  sql = sql.replace('`', '"')
+  sql = re.sub(r"(?<=\s)#", "--", sql)
+
+  sql = re.sub(r"\[ORDINAL\((\d+)\)\]", r"[\1]", sql, flags=re.I)
+  sql = re.sub(r"\[OFFSET\((\d+)\)\]", lambda m: f"[{int(m.group(1)) + 1}]", sql, flags=re.I)
+  sql = re.sub(r"\bINT64\b", "BIGINT", sql, flags=re.I)
+  sql = re.sub(r"\bFLOAT64\b", "DOUBLE", sql, flags=re.I)
+  sql = re.sub(r"\bTIMESTAMP\(([^()]*)\)", r"CAST(\1 AS TIMESTAMP)", sql, flags=re.I)
+  sql = re.sub(r"\bDATE\(([^()]*)\)", r"CAST(\1 AS DATE)", sql, flags=re.I)
+  sql = re.sub(r"\bTIMESTAMP_ADD\(((?:[^()]|\([^()]*\))*?),\s*(INTERVAL[^)]*)\)", r"(\1 + \2)", sql, flags=re.I)
+  sql = re.sub(r"\bTIMESTAMP_SECONDS\(", "to_timestamp(", sql, flags=re.I)
+
+  return sql
+
+def _duckdb_query_to_df(sql:str) -> pd.DataFrame:
+  global _duck_conn
+  import duckdb
+
+  # One shared database; views are registered under the lock and each query runs on its own cursor,
+  # so concurrent callers (e.g. the batch runner's fetch threads) never share a connection
+  with _duck_lock:
+    if _duck_conn is None:
+      _duck_conn = duckdb.connect()
+
+    for dataset, table in set(_TABLE_REF.findall(sql)):
+      view = f'{dataset}__{table}'
+      if view not in _duck_views:
+        source = _parquet_source(dataset, table).replace("'", "''")
+        _duck_conn.execute(f"CREATE OR REPLACE VIEW {view} AS SELECT * FROM read_parquet('{source}')")
+        _duck_views.add(view)
+
+    cursor = _duck_conn.cursor()
+
+  try:
+    return cursor.execute(to_duckdb_sql(sql)).df()
+  finally:
+    cursor.close()
+
+
+
 # Get Top-Line Experiment Summary Details
 def get_experiment_summary(experiment_id):
   query = f"""
@@ -488,8 +595,103 @@ def get_experiment_receipts(experiment_id, variant1 = None, variant2 = None):
 
 
 
+# Streaming Quantiles for Replicates Too Large to Hold in Memory
+class QuantileSketch():
+  """
+  Mergeable KLL quantile sketch. Feed replicates in with `update` (any chunk size), combine sketches
+  built by parallel workers with `merge`, and read quantiles with `quantile`.
+
+  Memory stays around 3 * k values however many replicates go in. `rank_error()` is an approximate bound on
+  the normalized rank error of returned quantiles (about 1.3% at the default k = 200). It borrows Apache
+  DataSketches' empirical KLL constants, which were measured for a different compaction schedule, so treat it
+  as a guide rather than a guarantee. Until the first compaction, quantiles equal `np.percentile` exactly;
+  the minimum and maximum are always exact.
+  """
+
+  def __init__(self, k = 200, seed = None):
+    self.k = k
+    self.n = 0
+    self.min = np.nan
+    self.max = np.nan
+    self.levels = [np.empty(0)]
+    self._rng = np.random.default_rng(seed)
+
+  def _capacity(self, level):
+    # Lower levels shrink geometrically from k at the top level
+    depth = len(self.levels) - level - 1
+    return max(8, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+  def _compress(self):
+    while any(buf.size > self._capacity(h) for h, buf in enumerate(self.levels)):
+      for h in range(len(self.levels)):
+        if self.levels[h].size <= self._capacity(h):
+          continue
+        if h + 1 == len(self.levels):
+          self.levels.append(np.empty(0))
+
+        # Keep every other item (random offset) at double weight; an odd one out stays behind
+        buf = np.sort(self.levels[h])
+        keep, buf = (buf[-1:], buf[:-1]) if buf.size % 2 else (buf[:0], buf)
+        self.levels[h + 1] = np.concatenate([self.levels[h + 1], buf[self._rng.integers(2)::2]])
+        self.levels[h] = keep
+
+  def update(self, values):
+    values = np.asarray(values, dtype = float).ravel()
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+      return self
+
+    self.n += values.size
+    self.min = np.fmin(self.min, values.min())
+    self.max = np.fmax(self.max, values.max())
+    self.levels[0] = np.concatenate([self.levels[0], values])
+    self._compress()
+    return self
+
+  def merge(self, other):
+    if other.k != self.k:
+      raise ValueError(f"Cannot merge sketches with different k ({self.k} and {other.k})")
+
+    while len(self.levels) < len(other.levels):
+      self.levels.append(np.empty(0))
+    for h, buf in enumerate(other.levels):
+      self.levels[h] = np.concatenate([self.levels[h], buf])
+
+    self.n += other.n
+    self.min = np.fmin(self.min, other.min)
+    self.max = np.fmax(self.max, other.max)
+    self._compress()
+    return self
+
+  def quantile(self, q):
+    """
+    Approximate quantile(s) for `q` in [0, 1].
+    """
+    q = np.asarray(q, dtype = float)
+    if self.n == 0:
+      return np.full(q.shape, np.nan)
+    if len(self.levels) == 1:
+      # Nothing compacted yet: match np.percentile's linear interpolation exactly
+      return np.quantile(self.levels[0], q)
+
+    items = np.concatenate(self.levels)
+    weights = np.concatenate([np.full(buf.size, 2.0 ** h) for h, buf in enumerate(self.levels)])
+    order = np.argsort(items, kind = 'stable')
+    items, cum_weights = items[order], np.cumsum(weights[order])
+
+    idx = np.minimum(np.searchsorted(cum_weights, q * cum_weights[-1], side = 'left'), items.size - 1)
+    return np.where(q <= 0, self.min, np.where(q >= 1, self.max, items[idx]))
+
+  def rank_error(self):
+    # Approximate (see class docstring); exact until the first compaction
+    return 0.0 if len(self.levels) == 1 else 2.296 / self.k ** 0.9723
+
+
+
 # Bootstrapping
-def bootstrap_sample(data, variant_col, metric_type, control_id, treatment_id, num_iterations):
+# With `sketch_k` set, replicates stream into QuantileSketch objects (in place of lists) to bound memory;
+# pass `seed` (anything np.random.default_rng accepts) for reproducible, independent resample streams
+def bootstrap_sample(data, variant_col, metric_type, control_id, treatment_id, num_iterations, sketch_k = None, chunk_size = 4096, seed = None):
   if metric_type == 'total':
     metric_col = 'total_cor'
   elif metric_type in ('bad_recoupments', 'chargebacks'):
@@ -501,45 +703,76 @@ def bootstrap_sample(data, variant_col, metric_type, control_id, treatment_id, n
   means_control = []
   means_treatment = []
 
+  # Arm codes: 0 = control, 1 = treatment, 2 = other variants and missing metric values (skipped, as in .mean())
+  rng = np.random.default_rng(seed)
+  # Sketch compaction draws from `rng` too, so sketch mode is as reproducible as list mode
+  sketches = [QuantileSketch(sketch_k, seed = rng.integers(2**63)) for _ in range(3)] if sketch_k else None
+  values = data[metric_col].to_numpy(dtype = float)
+  groups = np.select([data[variant_col] == control_id, data[variant_col] == treatment_id], [0, 1], 2)
+  groups[np.isnan(values)] = 2
+  values = np.nan_to_num(values)
+  n = len(values)
+
   for _ in range(num_iterations):
-      sample = data.sample(frac=1, replace=True)
+      # Resample all rows with replacement, then take each arm's mean over its resampled rows
+      idx = rng.integers(max(n, 1), size = n)
+      sample_groups = groups[idx]
+      sums = np.bincount(sample_groups, weights = values[idx], minlength = 3)
+      counts = np.bincount(sample_groups, minlength = 3)
 
-      mean_control = sample[sample[variant_col] == control_id][metric_col].mean()
-      mean_treatment = sample[sample[variant_col] == treatment_id][metric_col].mean()
+      with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        mean_control, mean_treatment = sums[:2] / counts[:2]
 
       means_control.append(mean_control)
       means_treatment.append(mean_treatment)
       diff_means.append(mean_treatment - mean_control)
 
+      if sketch_k and len(diff_means) >= chunk_size:
+        for sketch, chunk in zip(sketches, (diff_means, means_control, means_treatment)):
+          sketch.update(chunk)
+          chunk.clear()
+
+  if sketch_k:
+    for sketch, chunk in zip(sketches, (diff_means, means_control, means_treatment)):
+      sketch.update(chunk)
+    return tuple(sketches)
+
   return diff_means, means_control, means_treatment
 
 
 
-# Return Confidence Interval, Given a Difference Array and a P-Value
+# Return Confidence Interval, Given a Difference Array (or QuantileSketch) and a P-Value
 def return_conf_interval(array, p_val, test_type, one_tail_direction = None):
+  if isinstance(array, QuantileSketch):
+    percentile = lambda q: array.quantile(np.asarray(q) / 100)
+  else:
+    percentile = lambda q: np.percentile(array, q)
+
   if test_type == 'one-tailed':
     if one_tail_direction == 'increase':
-      confidence_interval = np.percentile(array, [100 * p_val, 100])
+      confidence_interval = percentile([100 * p_val, 100])
     elif one_tail_direction == 'decrease':
-      confidence_interval = np.percentile(array, [0, 100 * (1 - p_val)])
+      confidence_interval = percentile([0, 100 * (1 - p_val)])
     else:
       print('please enter a direction for the 1-tailed test')
   elif test_type == 'two-tailed':
-    confidence_interval = np.percentile(array, [(100 * p_val / 2), 100 * (1 - (p_val / 2))])
+    confidence_interval = percentile([(100 * p_val / 2), 100 * (1 - (p_val / 2))])
   
   return confidence_interval
 
 
 
-# Function to Return Markdown Text for Experiment Results
-def return_results():
-  str1 = f"{int(100 * (1 - p_value))}% Confidence Interval for {test_type.title()} Test Between '{treatment_picker.value.title()}' and '{control_picker.value.title()}': ({round(confidence_interval[0], 4)} - {round(confidence_interval[1], 4)})"
+# Markdown Text for Experiment Results, Given a Confidence Interval and the Compared Variants
+def results_markdown(confidence_interval, p_value, test_type, treatment, control):
+  treatment, control = str(treatment).title(), str(control).title()
+
+  str1 = f"{int(100 * (1 - p_value))}% Confidence Interval for {test_type.title()} Test Between '{treatment}' and '{control}': ({round(confidence_interval[0], 4)} - {round(confidence_interval[1], 4)})"
   if confidence_interval[0] <= 0 <= confidence_interval[1]:
     str2 = f"Unable to reject the null hypothesis:"
-    str3 = f"The results did not show a statistically significant difference between '{treatment_picker.value.title()}' and '{control_picker.value.title()}"
+    str3 = f"The results did not show a statistically significant difference between '{treatment}' and '{control}"
   else:
-    str2 = f"Significant difference between '{treatment_picker.value.title()}' and '{control_picker.value.title()}'"
-    str3 = f"The results indicate a statistically significant difference between '{treatment_picker.value.title()}' and '{control_picker.value.title()}"
+    str2 = f"Significant difference between '{treatment}' and '{control}'"
+    str3 = f"The results indicate a statistically significant difference between '{treatment}' and '{control}"
 
   output = f"""
   # <u>Experiment Results</u>
@@ -548,4 +781,11 @@ def return_results():
   ### *{str3}*
   """  
 
-  return md(output)
+  return output
+
+
+
+# Function to Return Markdown Text for Experiment Results
+def return_results(confidence_interval, p_value, test_type, treatment, control):
+  from IPython.display import Markdown as md
+  return md(results_markdown(confidence_interval, p_value, test_type, treatment, control))
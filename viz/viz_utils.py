@@ -3,6 +3,9 @@ import seaborn as sns
 from collections.abc import Iterable
 import pandas as pd
 import pandas.io.formats.style
+import numpy as np
+import copy
+from functools import lru_cache
 
 
 # credit to @Patrick L (pjxl) for EtsyColors & QStyler
@@ -26,9 +29,26 @@ class EtsyColors():
             'turquoise': {'dark': '#1A3B38', 'medium': '#2F766D', 'light': '#7ED4BD'},
             'bubblegum': {'dark': '#592642', 'medium': '#B54C82', 'light': '#F592B8'}
         }
+        # Memoized lookups; clear these if `library` is edited after use
+        self._hex_cache = {}
+        self._palette_cache = {}
+
+
+    @staticmethod
+    def __cache_key(x):
+        return tuple(x) if isinstance(x, Iterable) and not isinstance(x, str) else x
 
 
     def __hex_fetcher(self, hue=None, tint=None):
+        # Materialize one-shot iterables once, then use the same values as both key and input
+        hue, tint = self.__cache_key(hue), self.__cache_key(tint)
+        key = (hue, tint)
+        if key not in self._hex_cache:
+            self._hex_cache[key] = self.__fetch_hexes(hue, tint)
+        return list(self._hex_cache[key])
+
+
+    def __fetch_hexes(self, hue=None, tint=None):
         # If the input object isn't already a non-string iterable, make it one
         def to_iter(x):
             return [x] if not isinstance(x, Iterable) or isinstance(x, str) else x
@@ -86,7 +106,10 @@ class EtsyColors():
 
         hexes = self.__hex_fetcher(hue, tint)
 
-        pal = sns.color_palette(hexes, n_colors=n_colors)
+        key = (tuple(hexes), n_colors)
+        if key not in self._palette_cache:
+            self._palette_cache[key] = sns.color_palette(hexes, n_colors=n_colors)
+        pal = copy.copy(self._palette_cache[key])
         
         self.palette = pal if len(pal) > 0 else None
 
@@ -116,6 +139,90 @@ class EtsyColors():
         sns.palplot(pal)
         plt.show()
 
+_plot_colors = EtsyColors()
+
+
+def plot_replicates(replicates, conf_intervals=None, bins=100, hue='core', tint='medium', ncols=3, panel_size=(5, 3.5), show=True):
+    """
+    Plot bootstrap replicate distributions as pre-binned histograms, one panel per key of `replicates`.
+    `replicates` maps panel -> {label: array}; a bare {label: array} is plotted as a single panel.
+    `conf_intervals` maps panel -> (lower, upper), drawn as dashed lines. The interval from `return_conf_interval`
+    is on the scale of `diff_means`, so give it to the panel plotting the difference, not the per-arm means:
+
+        plot_replicates({'Arm means': {'Control': means_control, 'Treatment': means_treatment},
+                         'Difference': {'Treatment - Control': diff_means}},
+                        conf_intervals={'Difference': return_conf_interval(diff_means, 0.05, 'two-tailed')})
+
+    Colors come from `EtsyColors.make_palette(hue, tint)`. Returns the figure when `show` is False.
+    """
+    nested = [isinstance(v, dict) for v in replicates.values()]
+    if any(nested) and not all(nested):
+        raise ValueError("`replicates` must map every panel to a {label: array} dict, or be a single {label: array} dict")
+    if not any(nested):
+        replicates = {None: replicates}
+        conf_intervals = {None: conf_intervals} if conf_intervals is not None else None
+    conf_intervals = conf_intervals or {}
+
+    colors = _plot_colors
+    colors.make_palette(hue, tint)
+    pal = colors.palette or [colors.library['grey']['medium']]
+    ci_color = colors.library['grey']['dark']
+
+    ncols = max(1, min(ncols, len(replicates)))
+    nrows = -(-len(replicates) // ncols)
+    fig, axes = plt.subplots(nrows, ncols, figsize=(panel_size[0] * ncols, panel_size[1] * nrows), squeeze=False)
+
+    for ax, (metric, series) in zip(axes.flat, replicates.items()):
+        arrays = {label: np.asarray(a, dtype=float) for label, a in series.items()}
+        arrays = {label: a[np.isfinite(a)] for label, a in arrays.items()}
+        lo = min((a.min() for a in arrays.values() if a.size), default=0.0)
+        hi = max((a.max() for a in arrays.values() if a.size), default=1.0)
+        # Shared edges keep the overlaid series comparable; only the binned counts are drawn
+        edges = np.histogram_bin_edges([lo, hi], bins=bins)
+
+        for i, (label, a) in enumerate(arrays.items()):
+            counts, _ = np.histogram(a, bins=edges, density=a.size > 0)
+            ax.stairs(counts, edges, fill=True, alpha=0.5, color=pal[i % len(pal)], label=label)
+
+        ci = conf_intervals.get(metric)
+        if ci is not None:
+            for bound in ci:
+                ax.axvline(bound, color=ci_color, linestyle='--', linewidth=1)
+
+        if metric is not None:
+            ax.set_title(metric)
+        ax.legend()
+
+    for ax in list(axes.flat)[len(replicates):]:
+        ax.set_visible(False)
+
+    fig.tight_layout()
+    if show:
+        plt.show()
+    else:
+        return fig
+
+
+def _freeze_theme(theme, emap):
+    # Hashable form of a theme, with single values broadcast over every element in `emap`
+    frozen = []
+    for prop_name, mapper in theme.items():
+        if isinstance(mapper, str):
+            mapper = dict.fromkeys(emap, mapper)
+        frozen.append((prop_name, tuple((emap.get(element), val) for element, val in mapper.items())))
+    return tuple(frozen)
+
+
+@lru_cache(maxsize=None)
+def _compile_table_styles(frozen_theme):
+    # One rule per selector; later values for the same selector/property win
+    rules = {}
+    for prop_name, selectors in frozen_theme:
+        for selector, val in selectors:
+            rules.setdefault(selector, {})[prop_name] = val
+    return tuple((sel, tuple(props.items())) for sel, props in rules.items())
+
+
 class QStyler(pd.io.formats.style.Styler):
     emap = {'cell': 'td',
             'cells': 'td',
@@ -131,6 +238,12 @@ class QStyler(pd.io.formats.style.Styler):
         return self.style
 
 
+    def format(self, *args, **kwargs):
+        # Recorded so `page` can re-apply formatting to its slice of rows
+        self._format_calls = getattr(self, '_format_calls', []) + [(args, kwargs)]
+        return super().format(*args, **kwargs)
+
+
     def format_cell_values(self, formatter, subset=None, inplace=False):
         s = self.format(formatter, subset=subset)
 
@@ -141,11 +254,17 @@ class QStyler(pd.io.formats.style.Styler):
 
 
     def _style_setter(self, mapper, prop_name, inplace):
-        s = self
-        for element in mapper.keys():
-            selector = self.emap.get(element)
-            prop_val = mapper.get(element)
-            s.set_table_styles([{'selector': selector, 'props': [(prop_name, prop_val)]}], overwrite=False)
+        return self.set_theme({prop_name: mapper}, inplace)
+
+
+    def set_theme(self, theme, inplace=False):
+        """
+        Apply several table-level properties at once, e.g. `{'font-size': '11px', 'color': {'cell': '#222222'}}`.
+        Values are either a single value for every element in `emap` or an element -> value mapper.
+        The compiled CSS is cached per theme and applied in a single `set_table_styles` call.
+        """
+        styles = _compile_table_styles(_freeze_theme(theme, self.emap))
+        s = self.set_table_styles([{'selector': sel, 'props': list(props)} for sel, props in styles], overwrite=False)
 
         if inplace:
             self = s
@@ -153,6 +272,24 @@ class QStyler(pd.io.formats.style.Styler):
             return s
 
 
+    def page(self, number=0, page_size=1000):
+        """
+        Return a new QStyler over one page of rows (by position); page 0 doubles as a truncated view.
+        Only the page's rows are styled and rendered. Table styles, cell styling and formatting carry over,
+        and `set_background_gradient` scales against the full table so colors match the unpaged view.
+        """
+        n_pages = max(1, -(-len(self.data) // page_size)) if page_size > 0 else 0
+        if not 0 <= number < n_pages:
+            raise ValueError(f"page {number} out of range for {len(self.data)} rows at page_size={page_size}")
+
+        start = number * page_size
+        s = QStyler(self.data.iloc[start:start + page_size])
+        s.use(self.export())
+        for args, kwargs in self._format_calls:
+            s.format(*args, **kwargs)
+        return s
+
+
     def set_background_color(self, mapper, inplace=False):
         return self._style_setter(mapper, 'background-color', inplace)
 
@@ -205,7 +342,18 @@ class QStyler(pd.io.formats.style.Styler):
 
     def set_background_gradient(self, color='goldenrod', subset=None, inplace=False):
         cmap = sns.light_palette(color, as_cmap=True)
-        s = self.background_gradient(cmap, axis=None, subset=subset)
+
+        # Pin the color scale to the full table so paged views match the unpaged one
+        if subset is None:
+            vals = self.data
+        elif isinstance(subset, tuple):
+            vals = self.data.loc[subset]
+        else:
+            vals = self.data.loc[:, subset]
+        vals = vals.select_dtypes('number').to_numpy(dtype=float)
+        vmin, vmax = (np.nanmin(vals), np.nanmax(vals)) if vals.size else (None, None)
+
+        s = self.background_gradient(cmap, axis=None, subset=subset, vmin=vmin, vmax=vmax)
 
         if inplace:
             self = s